@@ -1,5 +1,8 @@
 import os
+import sys
+import re
 import asyncio
+import threading
 from dotenv import load_dotenv
 
 from semantic_kernel import Kernel
@@ -10,6 +13,8 @@ from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoic
 from semantic_kernel.functions.kernel_arguments import KernelArguments
 from semantic_kernel.functions import kernel_function
 
+from prompts import ENGLISH_AGENT_INSTR, ARABIC_AGENT_INSTR, TRANSLATION_AGENT_INSTR
+
 
 # -------------------------
 # Kernel Setup
@@ -32,15 +37,17 @@ kernel.add_service(
 # Legal Research Plugin
 # -------------------------
 
+# TODO replace with Cosmos DB CU JSON search
+LEGAL_RESEARCH_RESULT = """
+        Article 12: Borrower must repay the loan.
+        المادة 12: يلتزم المقترض بالسداد.
+        """
+
 class LegalResearchPlugin:
 
     @kernel_function(name="research")
     def research(self, query: str) -> str:
-        # TODO replace with Cosmos DB CU JSON search
-        return """
-        Article 12: Borrower must repay the loan.
-        المادة 12: يلتزم المقترض بالسداد.
-        """
+        return LEGAL_RESEARCH_RESULT
 
 kernel.add_plugin(LegalResearchPlugin(), "legal")
 
@@ -61,29 +68,21 @@ args = KernelArguments(
 english_agent = ChatCompletionAgent(
     kernel=kernel,
     name="EnglishAgent",
-    instructions="""
-You are an English legal agent.
-Always call legal.research first.
-Cite articles.
-""",
+    instructions=ENGLISH_AGENT_INSTR,
     arguments=args
 )
 
 arabic_agent = ChatCompletionAgent(
     kernel=kernel,
     name="ArabicAgent",
-    instructions="""
-أنت وكيل قانوني عربي.
-استدع legal.research أولاً.
-اذكر أرقام المواد.
-""",
+    instructions=ARABIC_AGENT_INSTR,
     arguments=args
 )
 
 translation_agent = ChatCompletionAgent(
     kernel=kernel,
     name="TranslationAgent",
-    instructions="Translate between Arabic and English preserving legal meaning.",
+    instructions=TRANSLATION_AGENT_INSTR,
     arguments=args
 )
 
@@ -91,8 +90,13 @@ translation_agent = ChatCompletionAgent(
 # Language Detection
 # -------------------------
 
+_ARABIC_RE = re.compile("[\u0600-\u06FF]")
+
 def detect_language(text):
-    return "arabic" if any('\u0600' <= c <= '\u06FF' for c in text) else "english"
+    # ASCII-only input (most English queries) cannot contain Arabic
+    if text.isascii():
+        return "english"
+    return "arabic" if _ARABIC_RE.search(text) else "english"
 
 # -------------------------
 # Orchestrator
@@ -110,15 +114,88 @@ async def route(query, thread):
 
     return await translation_agent.get_response(query, thread=thread)
 
+
+async def route_many(queries):
+    # independent queries run concurrently, each on its own thread
+    langs = [detect_language(q) for q in queries]
+    ar_qs = [q for q, lang in zip(queries, langs) if lang == "arabic"]
+    en_qs = [q for q, lang in zip(queries, langs) if lang == "english"]
+
+    responses = await asyncio.gather(
+        *[arabic_agent.get_response(q, thread=ChatHistoryAgentThread()) for q in ar_qs],
+        *[english_agent.get_response(q, thread=ChatHistoryAgentThread()) for q in en_qs],
+    )
+
+    # restore input order
+    ar_rs = iter(responses[:len(ar_qs)])
+    en_rs = iter(responses[len(ar_qs):])
+    return [next(ar_rs) if lang == "arabic" else next(en_rs) for lang in langs]
+
+# -------------------------
+# Warm-up
+# -------------------------
+
+async def _warmup():
+    # opt-in (--warmup): each call is a real, billed completion
+    # throwaway threads so warm-up turns never reach the user's history
+    results = await asyncio.gather(
+        english_agent.get_response("hi", thread=ChatHistoryAgentThread()),
+        arabic_agent.get_response("مرحبا", thread=ChatHistoryAgentThread()),
+        return_exceptions=True,
+    )
+    # warm-up is only an optimisation: report failures and carry on
+    for r in results:
+        if isinstance(r, Exception):
+            print(f"Warm-up failed: {r}", file=sys.stderr)
+
 # -------------------------
 # Chat Loop
 # -------------------------
 
+async def _read_lines(prompt=None):
+    # stdin is read on a daemon thread so Ctrl+C and shutdown never wait on a blocked input()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def reader():
+        try:
+            for line in iter(sys.stdin.readline, ""):
+                loop.call_soon_threadsafe(queue.put_nowait, line.rstrip("\n"))
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        except RuntimeError:
+            # loop already closed
+            pass
+
+    threading.Thread(target=reader, daemon=True).start()
+
+    while True:
+        if prompt:
+            print(prompt, end="", flush=True)
+        line = await queue.get()
+        if line is None:
+            return
+        yield line
+
 async def main():
     thread = ChatHistoryAgentThread()
 
-    while True:
-        q = input("Query: ")
+    if "--warmup" in sys.argv[1:]:
+        await _warmup()
+
+    if "--batch" in sys.argv[1:]:
+        # opt-in: answer all queued queries concurrently (independent threads, no shared history)
+        queries = []
+        async for q in _read_lines():
+            if q == "exit":
+                break
+            if q:
+                queries.append(q)
+
+        for r in await route_many(queries):
+            print("\n", r)
+        return
+
+    async for q in _read_lines("Query: "):
         if q == "exit":
             break
         r = await route(q, thread)
@@ -1,6 +1,14 @@
 import os
+import sys
+import re
 import asyncio
-import requests
+import threading
+import time
+import hashlib
+from collections import OrderedDict
+from diskcache import Cache
+import httpx
+import orjson
 from dotenv import load_dotenv
 
 from semantic_kernel import Kernel
@@ -11,6 +19,8 @@ from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoic
 from semantic_kernel.functions.kernel_arguments import KernelArguments
 from semantic_kernel.functions import kernel_function
 
+from prompts import ARABIC_LEGAL_AGENT_INSTR, ENGLISH_LEGAL_AGENT_INSTR
+
 
 ## Define the environment
 
@@ -20,6 +30,142 @@ SUBSCRIPTION_KEY = os.getenv("TRANS_SUB_KEY")
 REGION = os.getenv("TRANS_REGION")
 ENDPOINT = os.getenv("TRANS_ENDPOINT")
 MODEL_DEPLOYMENT = os.getenv("TRANS_MODEL_DEPLOYMENT")
+API_VERSION = "2025-05-01-preview"
+
+## Translator auth: "key" sends the subscription key on every call (default), "token" uses a cached bearer token
+AUTH_MODE = os.getenv("TRANS_AUTH_MODE", "key")
+TOKEN_ENDPOINT = os.getenv("TRANS_TOKEN_ENDPOINT")
+
+if AUTH_MODE == "token" and not TOKEN_ENDPOINT:
+    if not REGION:
+        raise RuntimeError("Set TRANS_REGION or TRANS_TOKEN_ENDPOINT to use TRANS_AUTH_MODE=token")
+    if REGION == "global":
+        TOKEN_ENDPOINT = "https://api.cognitive.microsoft.com/sts/v1.0/issueToken"
+    else:
+        TOKEN_ENDPOINT = f"https://{REGION}.api.cognitive.microsoft.com/sts/v1.0/issueToken"
+
+## Translator batch limits (items and characters per request)
+MAX_BATCH_ITEMS = 25
+MAX_BATCH_CHARS = 5000
+
+## Shared async HTTP client for the Translator API (connection pooled, closed when main() exits)
+_http = httpx.AsyncClient(
+    limits=httpx.Limits(max_keepalive_connections=200, max_connections=500),
+    timeout=30
+)
+
+## Translator access token cache (tokens are valid for 10 minutes, refresh after 9)
+TOKEN_TTL_SECONDS = 9 * 60
+_token_cache = {"token": None, "exp": 0.0}
+_token_lock = asyncio.Lock()
+
+
+async def _get_token():
+    if _token_cache["token"] and time.monotonic() < _token_cache["exp"]:
+        return _token_cache["token"]
+
+    ## single-flight refresh: concurrent callers wait for the one in progress
+    async with _token_lock:
+        if _token_cache["token"] and time.monotonic() < _token_cache["exp"]:
+            return _token_cache["token"]
+
+        r = await _http.post(
+            TOKEN_ENDPOINT,
+            headers={"Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY}
+        )
+        r.raise_for_status()
+
+        _token_cache["token"] = r.text
+        _token_cache["exp"] = time.monotonic() + TOKEN_TTL_SECONDS
+        return _token_cache["token"]
+
+
+async def _prefetch_token():
+    ## warm the token while the user types; a real failure surfaces on the next request
+    if AUTH_MODE != "token":
+        return
+    try:
+        await _get_token()
+    except httpx.HTTPError:
+        pass
+
+
+def _invalidate_token():
+    _token_cache["token"] = None
+    _token_cache["exp"] = 0.0
+
+
+async def _post_with_auth(url, params, headers, content):
+    if AUTH_MODE != "token":
+        return await _http.post(
+            url,
+            params=params,
+            headers={**headers, "Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY},
+            content=content
+        )
+
+    ## send with a cached bearer token; on 401/403 drop the token and retry once
+    for attempt in range(2):
+        token = await _get_token()
+        r = await _http.post(
+            url,
+            params=params,
+            headers={**headers, "Authorization": f"Bearer {token}"},
+            content=content
+        )
+        if r.status_code in (401, 403) and attempt == 0:
+            _invalidate_token()
+            continue
+        return r
+
+## Translation caches keyed by (from_lang, to_lang, deployment, api-version, hash(text)): in-memory LRU in front of a persistent disk cache
+TRANSLATION_CACHE_SIZE = 4096
+TRANSLATION_CACHE_DIR = os.getenv("TRANS_CACHE_DIR", "./.tcache")
+TRANSLATION_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+_translation_cache = OrderedDict()
+_tcache = Cache(TRANSLATION_CACHE_DIR, size_limit=2**30)
+
+
+def _cache_key(text, from_lang, to_lang):
+    ## deployment and api-version decide the translation, so a change to either must miss the cache
+    return (
+        from_lang,
+        to_lang,
+        MODEL_DEPLOYMENT,
+        API_VERSION,
+        hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    )
+
+
+def _remember(key, value):
+    _translation_cache[key] = value
+    _translation_cache.move_to_end(key)
+    if len(_translation_cache) > TRANSLATION_CACHE_SIZE:
+        _translation_cache.popitem(last=False)
+
+
+def _cache_get(key):
+    value = _translation_cache.get(key)
+    if value is not None:
+        _translation_cache.move_to_end(key)
+        return value
+
+    ## read-through: promote disk hits into memory
+    value = _tcache.get(key)
+    if value is not None:
+        _remember(key, value)
+    return value
+
+
+def _cache_put(key, value):
+    _remember(key, value)
+    _tcache.set(key, value, expire=TRANSLATION_CACHE_TTL_SECONDS)
+
+
+def clear_translation_cache():
+    _translation_cache.clear()
+    _tcache.clear()
+
 ## Activate the main kernel brain
 
 kernel = Kernel()
@@ -34,12 +180,14 @@ kernel.add_service(
     )
 )
 ## define the legal research plugin (with dummy data for now) and add it to the kernel
+## here will implement the knowledge base search later on (static result for now, built once)
+LEGAL_RESEARCH_RESULT = "المادة 12: يلتزم المقترض بسداد القرض."
+
 class LegalResearchPlugin:
 
     @kernel_function(name="research")
     def research(self, query: str) -> str:
-        ## here will implement the knowledge base search later on 
-        return "المادة 12: يلتزم المقترض بسداد القرض."
+        return LEGAL_RESEARCH_RESULT
 
 kernel.add_plugin(LegalResearchPlugin(), "legal")
 
@@ -48,14 +196,13 @@ kernel.add_plugin(LegalResearchPlugin(), "legal")
 
 class ExternalTranslationPlugin:
 
-    def translate_text(self, text, from_lang, to_lang, model_deployment):
+    async def translate_batch(self, texts, from_lang, to_lang, model_deployment):
         headers = {
-            "Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY,
             "Ocp-Apim-Subscription-Region": REGION,
             "Content-Type": "application/json",
         }
 
-        params = {"api-version": "2025-05-01-preview"}
+        params = {"api-version": API_VERSION}
 
         body = [{
             "Text": text,
@@ -64,32 +211,82 @@ class ExternalTranslationPlugin:
                 "language": to_lang,
                 "deploymentName": model_deployment
             }]
-        }]
+        } for text in texts]
 
-        r = requests.post(
+        r = await _post_with_auth(
             ENDPOINT,
             params=params,
             headers=headers,
-            json=body,
-            timeout=30
+            content=orjson.dumps(body)
         )
 
         r.raise_for_status()
-        data = r.json()
-
-        return data[0]["translations"][0]["text"]
+        data = orjson.loads(r.content)
+
+        return [d["translations"][0]["text"] for d in data]
+
+    async def translate_text(self, text, from_lang, to_lang, model_deployment):
+        translations = await self.translate_batch([text], from_lang, to_lang, model_deployment)
+        return translations[0]
+
+    async def translate_many(self, texts, from_lang, to_lang):
+        keys = [_cache_key(text, from_lang, to_lang) for text in texts]
+        results = [_cache_get(key) for key in keys]
+        missing = list(dict.fromkeys(
+            text for text, result in zip(texts, results) if result is None
+        ))
+
+        ## a single text over the per-request limit can never be sent; fail before any request goes out
+        oversized = [i for i, text in enumerate(texts) if len(text) > MAX_BATCH_CHARS]
+        if oversized:
+            raise ValueError(
+                f"Texts at positions {oversized} exceed the Translator limit of {MAX_BATCH_CHARS} characters per request"
+            )
+
+        ## split into requests within the Translator batch limits, then send them concurrently
+        batches = []
+        current, chars = [], 0
+        for text in missing:
+            if current and (len(current) >= MAX_BATCH_ITEMS or chars + len(text) > MAX_BATCH_CHARS):
+                batches.append(current)
+                current, chars = [], 0
+            current.append(text)
+            chars += len(text)
+        if current:
+            batches.append(current)
+
+        translated = await asyncio.gather(*(
+            self.translate_batch(batch, from_lang, to_lang, MODEL_DEPLOYMENT)
+            for batch in batches
+        ))
+
+        fresh = dict(zip(missing, (t for batch in translated for t in batch)))
+        for i, (text, key) in enumerate(zip(texts, keys)):
+            if results[i] is None:
+                results[i] = fresh[text]
+                _cache_put(key, results[i])
+
+        return results
 
     @kernel_function(name="translate")
-    def translate(self, text: str, from_lang: str, to_lang: str) -> str:
-        return self.translate_text(
+    async def translate(self, text: str, from_lang: str, to_lang: str) -> str:
+        key = _cache_key(text, from_lang, to_lang)
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+
+        translated = await self.translate_text(
             text,
             from_lang,
             to_lang,
             MODEL_DEPLOYMENT
         )
+        _cache_put(key, translated)
+        return translated
 
 
-kernel.add_plugin(ExternalTranslationPlugin(), "translation")
+translation_plugin = ExternalTranslationPlugin()
+kernel.add_plugin(translation_plugin, "translation")
 
 ## Define agents with instructions and shared settings
 
@@ -102,79 +299,154 @@ args = KernelArguments(
 arabic_agent = ChatCompletionAgent(
     kernel=kernel,
     name="ArabicLegalAgent",
-    instructions="""
-You are an Arabic legal agent.
-Always call legal.research.
-Answer only from legal corpus.
-Cite articles.
-""",
+    instructions=ARABIC_LEGAL_AGENT_INSTR,
     arguments=args
 )
 
 english_agent = ChatCompletionAgent(
     kernel=kernel,
     name="EnglishLegalAgent",
-    instructions="""
-You are an English legal agent.
-Always call legal.research.
-Answer only from legal corpus.
-Cite articles.
-""",
+    instructions=ENGLISH_LEGAL_AGENT_INSTR,
     arguments=args
 )
 
+AGENTS_BY_LANG = {"ar": arabic_agent, "en": english_agent}
+
 ## Define the knowledge base language (for routing and translation purposes)
 KB_LANGUAGE = "arabic"
 
 ## detect language function (simple heuristic based on presence of Arabic characters)
 
+_ARABIC_RE = re.compile("[\u0600-\u06FF]")
+
 def detect_language(text):
-    return "ar" if any('\u0600' <= c <= '\u06FF' for c in text) else "en"
+    ## ASCII-only input (most English queries) cannot contain Arabic
+    if text.isascii():
+        return "en"
+    return "ar" if _ARABIC_RE.search(text) else "en"
 
 ## creating router function that detects query language, translates if needed, routes to the correct agent, and translates back the answer if needed
 async def route(query, thread):
 
     q_lang = detect_language(query)
     kb_lang = "ar" if KB_LANGUAGE == "arabic" else "en"
-
-    working_query = query
+    need_translate = q_lang != kb_lang
 
     # Translate query → KB language
-    if q_lang != kb_lang:
-        working_query = kernel.plugins["translation"].translate(
-            query,
-            q_lang,
-            kb_lang
-        )
+    working_query = await translation_plugin.translate(query, q_lang, kb_lang) if need_translate else query
 
     # Call agent
-    if kb_lang == "ar":
-        answer = await arabic_agent.get_response(working_query, thread=thread)
-    else:
-        answer = await english_agent.get_response(working_query, thread=thread)
-
-    answer_text = str(answer)
+    answer = await AGENTS_BY_LANG[kb_lang].get_response(working_query, thread=thread)
 
     # Translate answer → user language
-    if q_lang != kb_lang:
-        answer_text = kernel.plugins["translation"].translate(
-            answer_text,
-            kb_lang,
-            q_lang
-        )
+    if need_translate:
+        return await translation_plugin.translate(str(answer), kb_lang, q_lang)
+    return str(answer)
+
+## translate each text for its (from_lang, to_lang) pair with one batched call per pair; None keeps the text as is
+async def _translate_all(texts, pairs):
+    out = list(texts)
+    for pair in set(p for p in pairs if p):
+        idx = [i for i, p in enumerate(pairs) if p == pair]
+        translated = await translation_plugin.translate_many([texts[i] for i in idx], *pair)
+        for i, t in zip(idx, translated):
+            out[i] = t
+    return out
+
+## router for a burst of independent queries: batched translation, concurrent agent calls (each on its own thread)
+async def route_many(queries):
+
+    q_langs = [detect_language(q) for q in queries]
+    kb_lang = "ar" if KB_LANGUAGE == "arabic" else "en"
 
-    return answer_text
+    working_queries = await _translate_all(
+        queries,
+        [(q_lang, kb_lang) if q_lang != kb_lang else None for q_lang in q_langs]
+    )
 
-## Chat looping 
-async def main():
-    thread = ChatHistoryAgentThread()
+    agent = AGENTS_BY_LANG[kb_lang]
+    answers = await asyncio.gather(*[
+        agent.get_response(q, thread=ChatHistoryAgentThread()) for q in working_queries
+    ])
+
+    return await _translate_all(
+        [str(a) for a in answers],
+        [(kb_lang, q_lang) if q_lang != kb_lang else None for q_lang in q_langs]
+    )
+
+## opt-in (--warmup) warm-up of the KB-language agent, the only one route() calls; each call is a real, billed completion
+async def _warmup():
+    kb_lang = "ar" if KB_LANGUAGE == "arabic" else "en"
+    greeting = "مرحبا" if kb_lang == "ar" else "hi"
+    ## throwaway thread so the warm-up turn never reaches the user's history; failures are reported, not fatal
+    try:
+        await AGENTS_BY_LANG[kb_lang].get_response(greeting, thread=ChatHistoryAgentThread())
+    except Exception as e:
+        print(f"Warm-up failed: {e}", file=sys.stderr)
+
+async def _read_lines(prompt=None):
+    ## stdin is read on a daemon thread so Ctrl+C and shutdown never wait on a blocked input()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def reader():
+        try:
+            for line in iter(sys.stdin.readline, ""):
+                loop.call_soon_threadsafe(queue.put_nowait, line.rstrip("\n"))
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        except RuntimeError:
+            ## loop already closed
+            pass
+
+    threading.Thread(target=reader, daemon=True).start()
 
     while True:
-        q = input("Query: ")
-        if q == "exit":
-            break
+        if prompt:
+            print(prompt, end="", flush=True)
+        line = await queue.get()
+        if line is None:
+            return
+        yield line
 
-        r = await route(q, thread)
-        print("\n", r)
+## Chat looping 
+async def main():
+    thread = ChatHistoryAgentThread()
+    prefetch = None
+
+    try:
+        if "--warmup" in sys.argv[1:]:
+            await _warmup()
+
+        if "--batch" in sys.argv[1:]:
+            ## opt-in: answer all queued queries concurrently (independent threads, no shared history)
+            queries = []
+            async for q in _read_lines():
+                if q == "exit":
+                    break
+                if q:
+                    queries.append(q)
+
+            for r in await route_many(queries):
+                print("\n", r)
+            return
+
+        ## refresh the token while the user types; route() joins an in-flight refresh through _token_lock
+        prefetch = asyncio.create_task(_prefetch_token())
+        async for q in _read_lines("Query: "):
+            if q == "exit":
+                break
+            if q == "clear-cache":
+                clear_translation_cache()
+                print("\n", "Translation cache cleared")
+                continue
+
+            r = await route(q, thread)
+            print("\n", r)
+            prefetch = asyncio.create_task(_prefetch_token())
+    finally:
+        if prefetch:
+            prefetch.cancel()
+        await _http.aclose()
+        _tcache.close()
 
 asyncio.run(main())
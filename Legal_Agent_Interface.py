@@ -1,12 +1,19 @@
 import time
 import random
 import io
-from datetime import datetime
+import hashlib
 import streamlit as st
 import os
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
 
+from azure.core.exceptions import ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
 from azure.identity import DefaultAzureCredential
 from azure.ai.projects import AIProjectClient
+from openai import APIStatusError, RateLimitError
 from pypdf import PdfReader
 
 
@@ -19,11 +26,17 @@ AGENT_NAME = "Legal-Agent2"
 
 MIN_SECONDS_BETWEEN_REQUESTS = 2.5
 MAX_RETRIES_429 = 6
+BACKOFF_BASE_SECONDS = 0.8
+BACKOFF_CAP_SECONDS = 20
+MAX_BACKOFF_SECONDS = 60
 
 # ✅ token control
 MAX_DOC_CHARS = 12000
 MAX_PDF_PAGES = 40
 
+# connection pooling
+HTTP_MAX_KEEPALIVE = 50
+
 st.set_page_config(page_title="Legal Agent (Foundry)", page_icon="⚖️", layout="centered")
 st.title("⚖️ Legal Agent")
 st.caption("Token-optimized • Streaming • Conversation memory")
@@ -36,9 +49,15 @@ st.caption("Token-optimized • Streaming • Conversation memory")
 def get_clients():
     os.environ.setdefault("OPENAI_API_VERSION", "2024-12-01-preview")
 
+    # pooled keep-alive connections for the project client, shared across reruns via cache_resource
+    # (the OpenAI client keeps its default DefaultHttpxClient, which already pools)
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=HTTP_MAX_KEEPALIVE))
+
     project = AIProjectClient(
         endpoint=ENDPOINT,
         credential=DefaultAzureCredential(),
+        transport=RequestsTransport(session=session, session_owner=False),
     )
 
     return project, project.agents, project.get_openai_client()
@@ -47,53 +66,119 @@ def get_clients():
 project, agents_ops, openai_client = get_clients()
 
 
+# -----------------------------
+# Background work
+# -----------------------------
+@st.cache_resource
+def get_loop():
+    # one long-lived loop shared by every rerun and session
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+async def _upload_doc(conv_id, agent_name, text):
+    await asyncio.to_thread(
+        openai_client.responses.create,
+        conversation=conv_id,
+        input=f"Reference document:\n{text}",
+        max_output_tokens=200,
+        extra_body={
+            "agent": {
+                "type": "agent_reference",
+                "name": agent_name,
+            }
+        },
+    )
+
+
 # -----------------------------
 # Agent lookup
 # -----------------------------
-def get_agent_by_name(agents_ops, name):
-    agent = next((a for a in agents_ops.list() if getattr(a, "name", None) == name), None)
-    if not agent:
+@st.cache_resource
+def get_agent_by_name(_agents_ops, name, endpoint=ENDPOINT):
+    # cached per (name, endpoint); `_agents_ops` is not hashed by Streamlit
+    try:
+        return _agents_ops.get(agent_name=name)
+    except ResourceNotFoundError:
         raise ValueError("Agent not found")
-    return agent
 
 
 # -----------------------------
 # Rate limit helpers
 # -----------------------------
 def is_rate_limit_error(e):
-    return "429" in str(e) or "rate" in str(e).lower()
+    if isinstance(e, RateLimitError):
+        return True
+    if isinstance(e, APIStatusError):
+        return e.status_code == 429
+    return False
+
+
+def backoff_sleep(prev, remaining):
+    # decorrelated jitter: next delay drawn from [base, 3 * previous], capped,
+    # and never longer than what is left of the total wait budget
+    delay = random.uniform(BACKOFF_BASE_SECONDS, min(BACKOFF_CAP_SECONDS, prev * 3))
+    delay = min(delay, remaining)
+    time.sleep(delay)
+    return delay
 
 
-def backoff_sleep(attempt):
-    delay = min(20, 0.8 * (2 ** attempt))
-    delay *= (0.75 + random.random() * 0.5)
-    time.sleep(delay)
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    def consume(self, n=1):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+        if self.tokens < n:
+            time.sleep((n - self.tokens) / self.rate)
+            self.tokens = n
+            self.last = time.monotonic()
 
+        self.tokens -= n
 
-def throttle_guard():
-    now = datetime.utcnow()
-    last = st.session_state.get("last_request")
-    if last:
-        diff = (now - last).total_seconds()
-        if diff < MIN_SECONDS_BETWEEN_REQUESTS:
-            time.sleep(MIN_SECONDS_BETWEEN_REQUESTS - diff)
-    st.session_state["last_request"] = datetime.utcnow()
+
+def get_bucket():
+    if "bucket" not in st.session_state:
+        st.session_state.bucket = TokenBucket(1 / MIN_SECONDS_BETWEEN_REQUESTS)
+    return st.session_state.bucket
 
 
 # -----------------------------
 # File extraction
 # -----------------------------
 def extract_text(uploaded):
-    name = uploaded.name.lower()
     raw = uploaded.getvalue()
+    digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    return _extract_text(digest, uploaded.name.lower(), raw)
+
 
+@st.cache_data(max_entries=16)
+def _extract_text(digest, name, _raw):
+    # parsed once per file contents; `_raw` itself is not hashed by Streamlit
     if name.endswith((".txt", ".md")):
-        return raw.decode("utf-8", errors="ignore")
+        return _raw.decode("utf-8", errors="ignore")
 
     if name.endswith(".pdf"):
-        reader = PdfReader(io.BytesIO(raw))
-        pages = reader.pages[:MAX_PDF_PAGES]
-        return "\n".join(p.extract_text() or "" for p in pages)
+        reader = PdfReader(io.BytesIO(_raw))
+        # stop decoding pages once the char budget is reached
+        buf = []
+        n = 0
+        for i, p in enumerate(reader.pages):
+            if i >= MAX_PDF_PAGES:
+                break
+            t = p.extract_text() or ""
+            buf.append(t)
+            n += len(t)
+            if n >= MAX_DOC_CHARS:
+                break
+        return "\n".join(buf)
 
     return ""
 
@@ -104,6 +189,25 @@ def truncate_text(text):
     return text
 
 
+# -----------------------------
+# Document upload
+# -----------------------------
+def wait_for_doc_upload():
+    # the document must be in the conversation before the next turn is sent
+    upload = st.session_state.get("doc_upload")
+    if not upload:
+        return
+
+    try:
+        with st.spinner("Indexing document…"):
+            upload.result()
+    except Exception as e:
+        st.session_state.doc_sent = False
+        st.warning(f"Document upload failed, answering without it: {e}")
+    finally:
+        st.session_state.doc_upload = None
+
+
 # -----------------------------
 # Streaming call
 # -----------------------------
@@ -116,7 +220,11 @@ def stream_agent(agent_name, conv_id, text):
     st.session_state.in_flight = True
 
     try:
-        throttle_guard()
+        wait_for_doc_upload()
+        get_bucket().consume(1)
+
+        delay = BACKOFF_BASE_SECONDS
+        waited = 0.0
 
         for attempt in range(MAX_RETRIES_429 + 1):
             try:
@@ -139,8 +247,10 @@ def stream_agent(agent_name, conv_id, text):
                 return
 
             except Exception as e:
-                if is_rate_limit_error(e) and attempt < MAX_RETRIES_429:
-                    backoff_sleep(attempt)
+                if is_rate_limit_error(e) and attempt < MAX_RETRIES_429 and waited < MAX_BACKOFF_SECONDS:
+                    slept = backoff_sleep(delay, MAX_BACKOFF_SECONDS - waited)
+                    waited += slept
+                    delay = max(BACKOFF_BASE_SECONDS, slept)
                     continue
                 raise
 
@@ -163,6 +273,14 @@ if "conversation_id" not in st.session_state:
 if "doc_sent" not in st.session_state:
     st.session_state.doc_sent = False
 
+# ✅ background doc upload failed → allow a resend
+upload = st.session_state.get("doc_upload")
+if upload and upload.done():
+    st.session_state.doc_upload = None
+    if upload.exception():
+        st.session_state.doc_sent = False
+        st.sidebar.error(f"Document upload failed: {upload.exception()}")
+
 agent = st.session_state.agent
 
 
@@ -175,25 +293,25 @@ st.sidebar.write(f"Conversation: {st.session_state.conversation_id}")
 uploaded = st.sidebar.file_uploader("Upload TXT/MD/PDF", type=["txt", "md", "pdf"])
 
 if uploaded:
-    text = truncate_text(extract_text(uploaded))
+    with st.sidebar, st.spinner("Extracting text…"):
+        text = truncate_text(extract_text(uploaded))
 
     if text:
         st.sidebar.success("Text extracted")
 
         # ✅ store once only
         if not st.session_state.doc_sent:
-            openai_client.responses.create(
-                conversation=st.session_state.conversation_id,
-                input=f"Reference document:\n{text}",
-                max_output_tokens=200,
-                extra_body={
-                    "agent": {
-                        "type": "agent_reference",
-                        "name": agent.name,
-                    }
-                },
+            st.session_state.doc_upload = asyncio.run_coroutine_threadsafe(
+                _upload_doc(st.session_state.conversation_id, agent.name, text),
+                get_loop(),
             )
             st.session_state.doc_sent = True
+            st.toast("Indexing…")
+
+        upload = st.session_state.get("doc_upload")
+        if upload and not upload.done():
+            st.sidebar.info("Indexing…")
+        elif st.session_state.doc_sent and not (upload and upload.exception()):
             st.sidebar.info("Document stored once in memory")
     else:
         st.sidebar.warning("No readable text found")
@@ -207,6 +325,7 @@ if st.sidebar.button("🆕 New conversation"):
     st.session_state.conversation_id = openai_client.conversations.create(items=[]).id
     st.session_state.messages = []
     st.session_state.doc_sent = False
+    st.session_state.doc_upload = None
     st.rerun()
 
 